@@ -0,0 +1,213 @@
+"""
+Per-endpoint admission control for the API workers.
+
+Every heavy endpoint takes a slot from a shared, per-process pool before it
+starts work. Each endpoint has its own concurrency cap and a bounded wait
+queue; when slots free up, waiting requests are admitted by priority so the
+interactive endpoints (/chat/, /evaluate_answer/) are not starved by a burst
+of /upload/ pipelines. Requests that cannot be queued, or that wait too long,
+get a 503 with a Retry-After header instead of piling up in memory.
+
+A slot can also be keyed (e.g. by chat domain): requests sharing a key run
+one after another, and each takes its endpoint slot only once it reaches the
+front of that line, so a queue for one key never holds idle slots.
+
+When disabled, the controller falls back to running one request at a time,
+which is how a worker behaved before the pipelines moved off the event loop.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+from fastapi import HTTPException
+
+
+@dataclass
+class EndpointLimit:
+    max_concurrency: int
+    max_queue: int
+    queue_timeout: float  # seconds a request may wait for a slot
+    priority: int  # lower value is admitted first
+
+
+class AdmissionController:
+    def __init__(self, capacity: int, limits: dict, enabled: bool = True):
+        self.capacity = capacity
+        self.limits = limits
+        self.enabled = enabled
+        self._total_active = 0
+        self._active = {name: 0 for name in limits}
+        self._queued = {name: 0 for name in limits}
+        self._service_time = {name: None for name in limits}
+        self._waiters = []  # heap of (priority, seq, endpoint, future)
+        self._seq = itertools.count()
+        self._serial = asyncio.Lock()
+        self._keyed = {}  # (endpoint, key) -> [lock, number of requests using it]
+
+    def _can_run(self, name: str) -> bool:
+        return (self._total_active < self.capacity
+                and self._active[name] < self.limits[name].max_concurrency)
+
+    def _grant(self, name: str):
+        self._active[name] += 1
+        self._total_active += 1
+
+    def _release(self, name: str):
+        self._active[name] -= 1
+        self._total_active -= 1
+        self._wake()
+
+    def _wake(self):
+        # Admit waiters in priority order until the shared pool is full,
+        # skipping those whose own endpoint is still at its cap.
+        blocked = []
+        while self._waiters and self._total_active < self.capacity:
+            entry = heapq.heappop(self._waiters)
+            _, _, name, future = entry
+            if future.done():
+                continue  # timed out or cancelled while queued
+            if self._active[name] < self.limits[name].max_concurrency:
+                self._queued[name] -= 1
+                self._grant(name)
+                future.set_result(None)
+            else:
+                blocked.append(entry)
+        for entry in blocked:
+            heapq.heappush(self._waiters, entry)
+
+    def _abandon(self, name: str, future: asyncio.Future):
+        if future.done() and not future.cancelled():
+            # The slot was granted in the same tick the wait gave up.
+            self._release(name)
+        else:
+            future.cancel()
+            self._queued[name] -= 1
+
+    def _record(self, name: str, elapsed: float):
+        previous = self._service_time[name]
+        self._service_time[name] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+
+    def retry_after(self, name: str) -> int:
+        """Rough number of seconds until a new request for `name` could be admitted."""
+        limit = self.limits[name]
+        service_time = self._service_time[name] or limit.queue_timeout
+        ahead = self._active[name] + self._queued[name]
+        return max(1, math.ceil(service_time * ahead / limit.max_concurrency))
+
+    def _reject(self, name: str, reason: str):
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server busy: {reason}. Please retry later.",
+            headers={"Retry-After": str(self.retry_after(name))}
+        )
+
+    async def _acquire(self, name: str):
+        if self._can_run(name):
+            self._grant(name)
+            return
+
+        limit = self.limits[name]
+        if self._queued[name] >= limit.max_queue:
+            print(f"Admission: rejecting {name}, queue full ({self._queued[name]} waiting)")
+            self._reject(name, f"{name} queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (limit.priority, next(self._seq), name, future))
+        self._queued[name] += 1
+        try:
+            await asyncio.wait_for(future, limit.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(name, future)
+            print(f"Admission: rejecting {name}, waited {limit.queue_timeout}s for a slot")
+            self._reject(name, f"timed out waiting for a {name} slot")
+        except asyncio.CancelledError:
+            self._abandon(name, future)
+            raise
+
+    @asynccontextmanager
+    async def _key_lock(self, name: str, key):
+        entry = self._keyed.setdefault((name, key), [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            try:
+                await asyncio.wait_for(entry[0].acquire(), self.limits[name].queue_timeout)
+            except asyncio.TimeoutError:
+                print(f"Admission: rejecting {name}, waited {self.limits[name].queue_timeout}s behind {key!r}")
+                self._reject(name, f"timed out waiting behind other {name} requests")
+            try:
+                yield
+            finally:
+                entry[0].release()
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._keyed[(name, key)]
+
+    @asynccontextmanager
+    async def slot(self, name: str, key=None):
+        """
+        Hold one `name` slot for the duration of the block, or raise a 503.
+
+        With a `key`, requests for the same key are serialised first and only
+        the one at the front of the line competes for a slot.
+        """
+        if key is not None:
+            async with self._key_lock(name, key):
+                async with self.slot(name):
+                    yield
+            return
+
+        if not self.enabled:
+            async with self._serial:
+                yield
+            return
+
+        await self._acquire(name)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._record(name, time.monotonic() - started)
+            self._release(name)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "endpoints": {
+                name: {
+                    "active": self._active[name],
+                    "queued": self._queued[name],
+                    "max_concurrency": self.limits[name].max_concurrency,
+                    "max_queue": self.limits[name].max_queue,
+                }
+                for name in self.limits
+            }
+        }
+
+
+def _limit_from_env(prefix: str, max_concurrency: int, max_queue: int, queue_timeout: float, priority: int) -> EndpointLimit:
+    return EndpointLimit(
+        max_concurrency=max(1, int(os.getenv(f"{prefix}_MAX_CONCURRENCY", max_concurrency))),
+        max_queue=max(0, int(os.getenv(f"{prefix}_MAX_QUEUE", max_queue))),
+        queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT", queue_timeout)),
+        priority=int(os.getenv(f"{prefix}_PRIORITY", priority))
+    )
+
+
+def admission_from_env() -> AdmissionController:
+    """Build the worker's controller from ADMISSION_* / <ENDPOINT>_* environment variables."""
+    limits = {
+        "upload": _limit_from_env("UPLOAD", max_concurrency=1, max_queue=4, queue_timeout=60, priority=10),
+        "chat": _limit_from_env("CHAT", max_concurrency=6, max_queue=32, queue_timeout=15, priority=0),
+        "evaluate": _limit_from_env("EVALUATE", max_concurrency=6, max_queue=32, queue_timeout=15, priority=0),
+    }
+    return AdmissionController(
+        capacity=max(1, int(os.getenv("ADMISSION_MAX_CONCURRENCY", "8"))),
+        limits=limits,
+        enabled=os.getenv("ADMISSION_ENABLED", "true").lower() not in ("0", "false", "no")
+    )
@@ -0,0 +1,253 @@
+"""
+Local load test for the API's admission control.
+
+Drives the real FastAPI app in-process with a mix of /upload/, /chat/ and
+/evaluate_answer/ traffic and reports p50/p99 latency and throughput per
+endpoint under three modes:
+
+  serial     admission control disabled: one request at a time, as a worker
+             behaved before the pipelines moved off the event loop
+  unlimited  pipelines run in the threadpool with no caps, the unbounded
+             burst admission control exists to prevent
+  limited    admission control enabled with the configured limits
+
+The Groq model is replaced by a stub whose latency grows with the number of
+in-flight calls and which fails like a rate-limited provider when overloaded.
+By default OCR and the Chroma write are simulated too (CPU-bound work, and a
+sleep under the app's own chroma_write_lock); pass --resume/--jd to run the
+real OCR + vector store.
+
+Importing main still loads the OCR and embedding models, so the first run
+downloads their weights. No Groq API key is needed.
+
+    python loadtest.py --duration 30 --upload-users 8 --chat-users 4 --chat-domains 1 --eval-users 4
+
+Limits are read from the same environment variables as the server
+(ADMISSION_MAX_CONCURRENCY, UPLOAD_MAX_CONCURRENCY, CHAT_MAX_QUEUE, ...).
+"""
+import argparse
+import asyncio
+import math
+import os
+import threading
+import time
+
+os.environ.setdefault("GROQ_API_KEY", "loadtest-stub")
+
+import httpx
+from langchain_core.messages import AIMessage
+
+import main
+from admission import AdmissionController, EndpointLimit, admission_from_env
+
+
+class StubLLM:
+    """Stands in for ChatGroq: latency rises with concurrency, errors past the rate limit."""
+
+    def __init__(self, latency: float, capacity: int):
+        self.latency = latency
+        self.capacity = capacity
+        self.inflight = 0
+        self.lock = threading.Lock()
+
+    def _call(self):
+        with self.lock:
+            self.inflight += 1
+            inflight = self.inflight
+        try:
+            if inflight > 2 * self.capacity:
+                raise RuntimeError(f"429 Too Many Requests (stub LLM, {inflight} in flight)")
+            time.sleep(self.latency * (1 + inflight / self.capacity))
+        finally:
+            with self.lock:
+                self.inflight -= 1
+
+    def invoke(self, prompt):
+        self._call()
+        return AIMessage(content="SCORE: 80\nFEEDBACK:\nStub feedback.\nSTRENGTHS:\nStub.\nIMPROVEMENTS:\nStub.")
+
+    def with_structured_output(self, schema):
+        llm = self
+
+        class Structured:
+            def invoke(self, prompt):
+                llm._call()
+                return schema(Ats_score=80, similar=70)
+
+        return Structured()
+
+
+def calibrate_cpu_work(seconds: float) -> int:
+    """Iterations of busy work that take `seconds` on one idle thread."""
+    iterations, started = 0, time.perf_counter()
+    while time.perf_counter() - started < 0.2:
+        sum(range(1000))
+        iterations += 1
+    return max(1, int(iterations * seconds / 0.2))
+
+
+def install_stubs(args):
+    llm = StubLLM(args.llm_latency, args.llm_capacity)
+    main.model = llm
+    main.strucuted_output = llm.with_structured_output(main.analyse)
+
+    if args.resume and args.jd:
+        return  # keep the real OCR and Chroma steps
+
+    ocr_iterations = calibrate_cpu_work(args.ocr_seconds)
+
+    def Upload(state: dict):
+        # OCR is CPU bound, so concurrent runs contend for the same cores
+        for _ in range(ocr_iterations):
+            sum(range(1000))
+        return {'parsePDF_resume': "stub resume text", 'parsePDF_JD': "stub job description"}
+
+    def Chunking_embedding_vectorstore(state: dict):
+        # Same locking as the real step: only the ./chroma_db write is serialised
+        with main.chroma_write_lock:
+            time.sleep(args.chroma_seconds)
+        return {'skills': "stub skills", 'exp': "stub experience", 'projects': "stub projects"}
+
+    main.Upload = Upload
+    main.Chunking_embedding_vectorstore = Chunking_embedding_vectorstore
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    # Nearest-rank: the smallest sample with at least pct% of samples at or below it
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def is_fallback(endpoint: str, payload: dict) -> bool:
+    """True for 200 responses that only carry an error or a canned fallback."""
+    if "error" in payload:
+        return True
+    # evaluate_answer() swallows LLM failures and answers with this placeholder
+    return endpoint == "evaluate" and payload.get("feedback", "").startswith("Unable to evaluate")
+
+
+async def user(client, endpoint: str, make_request, deadline: float, results: dict):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await make_request(client)
+        elapsed = time.perf_counter() - started
+
+        if response.status_code == 200 and not is_fallback(endpoint, response.json()):
+            results[endpoint]["ok"].append(elapsed)
+        elif response.status_code == 503:
+            results[endpoint]["rejected"] += 1
+            # Back off as a well-behaved client would, without idling past the end of the run
+            retry_after = float(response.headers.get("Retry-After", "1"))
+            await asyncio.sleep(min(retry_after, 2.0, max(0.0, deadline - time.perf_counter())))
+        else:
+            results[endpoint]["errors"] += 1
+
+
+def make_controller(mode: str) -> AdmissionController:
+    if mode == "unlimited":
+        # Caps far beyond the load generated, so nothing ever queues or is rejected
+        limit = EndpointLimit(max_concurrency=10**6, max_queue=10**6, queue_timeout=3600, priority=0)
+        return AdmissionController(10**6, {name: limit for name in ("upload", "chat", "evaluate")})
+    controller = admission_from_env()
+    controller.enabled = mode == "limited"
+    return controller
+
+
+async def run_scenario(args, mode: str) -> dict:
+    main.admission = make_controller(mode)
+
+    if args.resume and args.jd:
+        with open(args.resume, "rb") as f:
+            resume_bytes = f.read()
+        with open(args.jd, "rb") as f:
+            jd_bytes = f.read()
+    else:
+        resume_bytes = jd_bytes = b"%PDF-1.4 stub"
+
+    async def upload(client):
+        files = {
+            "resume": ("resume.pdf", resume_bytes, "application/pdf"),
+            "job_description": ("jd.pdf", jd_bytes, "application/pdf"),
+        }
+        return await client.post("/upload/", files=files)
+
+    def chat_for(domain):
+        async def chat(client):
+            return await client.post("/chat/", json={"message": "Ask me a question", "domain": domain})
+        return chat
+
+    async def evaluate(client):
+        return await client.post("/evaluate_answer/", json={
+            "question": "What is a closure?",
+            "student_answer": "A function that captures variables from its enclosing scope.",
+            "correct_answer": "A function bundled with references to its surrounding state.",
+            "question_type": "technical",
+        })
+
+    results = {name: {"ok": [], "rejected": 0, "errors": 0} for name in ("upload", "chat", "evaluate")}
+    # Unhandled errors (e.g. a stub 429 in /chat/) must come back as 500s, not abort the run
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        deadline = time.perf_counter() + args.duration
+        users = (
+            [user(client, "upload", upload, deadline, results) for _ in range(args.upload_users)]
+            + [user(client, "chat", chat_for(f"loadtest-{i % args.chat_domains}"), deadline, results) for i in range(args.chat_users)]
+            + [user(client, "evaluate", evaluate, deadline, results) for _ in range(args.eval_users)]
+        )
+        started = time.perf_counter()
+        await asyncio.gather(*users)
+        wall = time.perf_counter() - started
+
+    for stats in results.values():
+        stats["wall"] = wall
+    return results
+
+
+def report(title: str, results: dict):
+    print(f"\n{title}")
+    print(f"{'endpoint':<10}{'ok':>6}{'503':>6}{'errors':>8}{'p50 (s)':>10}{'p99 (s)':>10}{'ok/s':>8}")
+    for endpoint, stats in results.items():
+        ok = stats["ok"]
+        print(
+            f"{endpoint:<10}{len(ok):>6}{stats['rejected']:>6}{stats['errors']:>8}"
+            f"{percentile(ok, 50):>10.2f}{percentile(ok, 99):>10.2f}{len(ok) / stats['wall']:>8.2f}"
+        )
+
+
+MODES = {
+    "serial": "Admission control disabled (one request at a time)",
+    "unlimited": "No limits (every request runs at once)",
+    "limited": "With admission control",
+}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Load test /upload/, /chat/ and /evaluate_answer/ with a stubbed LLM")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load per scenario")
+    parser.add_argument("--upload-users", type=int, default=8)
+    parser.add_argument("--chat-users", type=int, default=4)
+    parser.add_argument("--chat-domains", type=int, default=1,
+                        help="distinct chat domains shared round-robin by chat users, as real clients share them")
+    parser.add_argument("--eval-users", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="stub LLM latency per call when idle")
+    parser.add_argument("--llm-capacity", type=int, default=8, help="in-flight calls before the stub LLM slows down")
+    parser.add_argument("--ocr-seconds", type=float, default=1.0, help="CPU time of one simulated OCR run")
+    parser.add_argument("--chroma-seconds", type=float, default=0.2, help="time one simulated Chroma write holds the store")
+    parser.add_argument("--resume", help="resume PDF; with --jd, runs the real OCR and vector store")
+    parser.add_argument("--jd", help="job description PDF")
+    parser.add_argument("--mode", choices=("all",) + tuple(MODES), default="all")
+    args = parser.parse_args()
+    if args.chat_domains < 1:
+        parser.error("--chat-domains must be at least 1")
+
+    install_stubs(args)
+    for mode, title in MODES.items():
+        if args.mode in ("all", mode):
+            report(title, asyncio.run(run_scenario(args, mode)))
+
+
+if __name__ == "__main__":
+    main_cli()
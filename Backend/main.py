@@ -1,5 +1,6 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from langgraph.graph import START, END, StateGraph
 from doctr.io import DocumentFile
 from doctr.models import ocr_predictor
@@ -15,8 +16,10 @@ from sentence_transformers import SentenceTransformer
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_core.prompts import PromptTemplate
 from dotenv import load_dotenv
+from admission import admission_from_env
 import os
 import shutil
+import threading
 
 
 load_dotenv()
@@ -39,6 +42,9 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+# Caps how many OCR/LLM pipelines this worker runs at once (see admission.py)
+admission = admission_from_env()
+
 # Get Groq API key from environment variables
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
@@ -107,6 +113,9 @@ def Upload(state: dict):
 # Sentence Transformer Embeddings
 embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
 
+# Every upload persists to the same ./chroma_db, so writes go one at a time
+chroma_write_lock = threading.Lock()
+
 
 def Chunking_embedding_vectorstore(state: ChatBot):
     splitter = RecursiveCharacterTextSplitter.from_language(
@@ -117,7 +126,8 @@ def Chunking_embedding_vectorstore(state: ChatBot):
     chunks = splitter.split_text(state['parsePDF_resume'])
     chunks_index = splitter.create_documents(chunks)
 
-    vector_store = Chroma.from_documents(chunks_index, embeddings, persist_directory="./chroma_db")
+    with chroma_write_lock:
+        vector_store = Chroma.from_documents(chunks_index, embeddings, persist_directory="./chroma_db")
     retriever = vector_store.as_retriever(search_type='similarity', search_kwargs={'k': 4})
 
     retriever_doc = retriever.invoke("Technical and Soft Skills")
@@ -464,11 +474,16 @@ async def test_endpoint():
         "message": "Test endpoint working",
         "ats_score": 85,
         "similarity_score": 78,
-        "timestamp": "2024-01-01"
+        "timestamp": "2024-01-01",
+        "admission": admission.stats()
     }
 
 @app.post("/upload/")
 async def upload_files(resume: UploadFile = File(...), job_description: UploadFile = File(...)):
+    async with admission.slot("upload"):
+        return await analyse_uploads(resume, job_description)
+
+async def analyse_uploads(resume: UploadFile, job_description: UploadFile):
     try:
         print(f"Received files: Resume: {resume.filename}, JD: {job_description.filename}")
         
@@ -510,27 +525,27 @@ async def upload_files(resume: UploadFile = File(...), job_description: UploadFi
         print("Starting workflow with files:", resume_path, jd_path)
         
         # Step 1: Upload and OCR
-        upload_result = Upload({"pdf_path": resume_path, "JD_path": jd_path})
+        upload_result = await run_in_threadpool(Upload, {"pdf_path": resume_path, "JD_path": jd_path})
         workflow_state.update(upload_result)
         print("Upload complete:", upload_result)
         
         # Step 2: Chunking and embedding
-        chunk_result = Chunking_embedding_vectorstore(workflow_state)
+        chunk_result = await run_in_threadpool(Chunking_embedding_vectorstore, workflow_state)
         workflow_state.update(chunk_result)
         print("Chunking complete:", chunk_result)
         
         # Step 3: Similarity analysis
-        sim_result = similarity(workflow_state)
+        sim_result = await run_in_threadpool(similarity, workflow_state)
         workflow_state.update(sim_result)
         print("Similarity analysis complete:", sim_result)
         
         # Step 4: Resume analysis
-        analysis_result = Analyse_resume(workflow_state)
+        analysis_result = await run_in_threadpool(Analyse_resume, workflow_state)
         workflow_state.update(analysis_result)
         print("Resume analysis complete:", analysis_result)
         
         # Step 5: Generate questions
-        question_result = Question(workflow_state)
+        question_result = await run_in_threadpool(Question, workflow_state)
         workflow_state.update(question_result)
         print("Question generation complete:", question_result)
         
@@ -575,6 +590,11 @@ chat_sessions = {}
 
 @app.post("/chat/")
 async def chat(chat_message: ChatMessage):
+    # Keyed by domain so a session's history is never created or updated concurrently
+    async with admission.slot("chat", key=chat_message.domain or ""):
+        return await chat_reply(chat_message)
+
+async def chat_reply(chat_message: ChatMessage):
     if chat_message.domain and chat_message.domain not in chat_sessions:
         # Initialize new chat session with domain
         checkpointer = MemorySaver()
@@ -590,7 +610,7 @@ async def chat(chat_message: ChatMessage):
         config = {'configurable': {'thread_id': thread_id}}
         
         initial_prompt = f"You are a helpful AI assistant. I am in an interview, and my candidate's domain is {chat_message.domain}."
-        response = work.invoke({'message': [HumanMessage(content=initial_prompt)]}, config=config)
+        response = await run_in_threadpool(work.invoke, {'message': [HumanMessage(content=initial_prompt)]}, config=config)
         
         chat_sessions[chat_message.domain] = {
             'work': work,
@@ -601,7 +621,8 @@ async def chat(chat_message: ChatMessage):
     if not session:
         return {"error": "No active chat session. Please provide a domain."}
     
-    response = session['work'].invoke(
+    response = await run_in_threadpool(
+        session['work'].invoke,
         {'message': [HumanMessage(content=chat_message.message)]}, 
         config=session['config']
     )
@@ -619,12 +640,14 @@ async def evaluate_student_answer(answer_submission: AnswerSubmission):
         print(f"Student Answer: {answer_submission.student_answer[:100]}...")
         
         # Evaluate the answer using AI
-        evaluation_result = evaluate_answer(
-            question=answer_submission.question,
-            student_answer=answer_submission.student_answer,
-            correct_answer=answer_submission.correct_answer,
-            question_type=answer_submission.question_type
-        )
+        async with admission.slot("evaluate"):
+            evaluation_result = await run_in_threadpool(
+                evaluate_answer,
+                question=answer_submission.question,
+                student_answer=answer_submission.student_answer,
+                correct_answer=answer_submission.correct_answer,
+                question_type=answer_submission.question_type
+            )
         
         # Create response
         evaluation_response = AnswerEvaluation(
@@ -637,7 +660,9 @@ async def evaluate_student_answer(answer_submission: AnswerSubmission):
         
         print(f"Evaluation complete - Score: {evaluation_response.score}/100")
         return evaluation_response
-        
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error evaluating answer: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error evaluating answer: {str(e)}")
@@ -0,0 +1,199 @@
+import asyncio
+import unittest
+
+from fastapi import HTTPException
+
+from admission import AdmissionController, EndpointLimit
+
+
+def make_controller(capacity=2, upload=None, chat=None):
+    return AdmissionController(capacity, {
+        "upload": upload or EndpointLimit(max_concurrency=1, max_queue=2, queue_timeout=5, priority=10),
+        "chat": chat or EndpointLimit(max_concurrency=2, max_queue=4, queue_timeout=5, priority=0),
+    })
+
+
+class AdmissionControllerTest(unittest.IsolatedAsyncioTestCase):
+    def assertNoSlotsHeld(self, controller):
+        for name, stats in controller.stats()["endpoints"].items():
+            self.assertEqual((stats["active"], stats["queued"]), (0, 0), name)
+        self.assertEqual(controller._total_active, 0)
+
+    async def test_queued_chat_is_admitted_before_queued_upload(self):
+        controller = make_controller(capacity=1, upload=EndpointLimit(2, 2, 5, 10))
+        order = []
+        release = asyncio.Event()
+
+        async def job(name, tag, hold=None):
+            async with controller.slot(name):
+                order.append(tag)
+                if hold:
+                    await hold.wait()
+
+        holder = asyncio.create_task(job("upload", "u0", release))
+        await asyncio.sleep(0)
+        upload = asyncio.create_task(job("upload", "u1"))
+        await asyncio.sleep(0)
+        chat = asyncio.create_task(job("chat", "c0"))
+        await asyncio.sleep(0)
+
+        release.set()
+        await asyncio.gather(holder, upload, chat)
+        self.assertEqual(order, ["u0", "c0", "u1"])
+        self.assertNoSlotsHeld(controller)
+
+    async def test_full_queue_rejects_with_retry_after(self):
+        controller = make_controller(upload=EndpointLimit(max_concurrency=1, max_queue=1, queue_timeout=30, priority=10))
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot("upload"):
+                await release.wait()
+
+        running = asyncio.create_task(hold())
+        waiting = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+
+        with self.assertRaises(HTTPException) as ctx:
+            async with controller.slot("upload"):
+                pass
+        self.assertEqual(ctx.exception.status_code, 503)
+        # No service time recorded yet: one running + one queued, 30s each
+        self.assertEqual(ctx.exception.headers["Retry-After"], "60")
+
+        release.set()
+        await asyncio.gather(running, waiting)
+        self.assertNoSlotsHeld(controller)
+
+    async def test_timed_out_waiter_does_not_leak_a_slot(self):
+        controller = make_controller(upload=EndpointLimit(max_concurrency=1, max_queue=2, queue_timeout=0.05, priority=10))
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot("upload"):
+                await release.wait()
+
+        running = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+
+        with self.assertRaises(HTTPException) as ctx:
+            async with controller.slot("upload"):
+                pass
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertIn("Retry-After", ctx.exception.headers)
+
+        release.set()
+        await running
+        self.assertNoSlotsHeld(controller)
+
+    async def test_cancelled_waiter_does_not_leak_a_slot(self):
+        controller = make_controller()
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot("upload"):
+                await release.wait()
+
+        running = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        self.assertEqual(controller.stats()["endpoints"]["upload"]["queued"], 1)
+
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+
+        release.set()
+        await running
+        self.assertNoSlotsHeld(controller)
+
+        # The freed slot is usable straight away
+        async with controller.slot("upload"):
+            self.assertEqual(controller.stats()["endpoints"]["upload"]["active"], 1)
+
+    async def test_same_key_requests_do_not_hold_idle_slots(self):
+        # Shipped defaults: capacity 8, chat 6, upload 1, evaluate 6
+        controller = AdmissionController(8, {
+            "upload": EndpointLimit(max_concurrency=1, max_queue=4, queue_timeout=60, priority=10),
+            "chat": EndpointLimit(max_concurrency=6, max_queue=32, queue_timeout=15, priority=0),
+            "evaluate": EndpointLimit(max_concurrency=6, max_queue=32, queue_timeout=15, priority=0),
+        })
+        release_upload = asyncio.Event()
+        chat_peak = 0
+
+        async def upload():
+            async with controller.slot("upload"):
+                await release_upload.wait()
+
+        async def chat():
+            nonlocal chat_peak
+            async with controller.slot("chat", key="Software Engineering"):
+                chat_peak = max(chat_peak, controller.stats()["endpoints"]["chat"]["active"])
+                await asyncio.sleep(0.05)
+
+        async def evaluate():
+            started = asyncio.get_running_loop().time()
+            async with controller.slot("evaluate"):
+                await asyncio.sleep(0.05)
+            return asyncio.get_running_loop().time() - started
+
+        uploading = asyncio.create_task(upload())
+        chats = [asyncio.create_task(chat()) for _ in range(6)]
+        await asyncio.sleep(0)
+
+        elapsed = await asyncio.gather(*(evaluate() for _ in range(4)))
+        # All four evaluations ran side by side instead of queueing for one slot
+        self.assertLess(max(elapsed), 0.09)
+        self.assertEqual(chat_peak, 1)
+
+        release_upload.set()
+        await asyncio.gather(uploading, *chats)
+        self.assertNoSlotsHeld(controller)
+        self.assertEqual(controller._keyed, {})
+
+    async def test_key_wait_times_out_with_retry_after(self):
+        controller = make_controller(chat=EndpointLimit(max_concurrency=2, max_queue=4, queue_timeout=0.05, priority=0))
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot("chat", key="python"):
+                await release.wait()
+
+        running = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+
+        with self.assertRaises(HTTPException) as ctx:
+            async with controller.slot("chat", key="python"):
+                pass
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertIn("Retry-After", ctx.exception.headers)
+
+        # Other keys are not held up
+        async with controller.slot("chat", key="java"):
+            pass
+
+        release.set()
+        await running
+        self.assertNoSlotsHeld(controller)
+        self.assertEqual(controller._keyed, {})
+
+    async def test_disabled_runs_one_request_at_a_time(self):
+        controller = make_controller()
+        controller.enabled = False
+        running = peak = 0
+
+        async def job(name):
+            nonlocal running, peak
+            async with controller.slot(name):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(job("upload"), job("chat"), job("chat"))
+        self.assertEqual(peak, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()